@@ -0,0 +1,227 @@
+import os
+import time
+import random
+import logging
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+# Set up logging
+logging.basicConfig(
+    filename='backfill.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Supabase client
+supabase: Client = create_client(
+    os.environ.get('SUPABASE_URL'),
+    os.environ.get('SUPABASE_KEY')
+)
+
+SEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+
+# Places statuses worth retrying; anything else (ZERO_RESULTS, NOT_FOUND, ...) is final
+RETRYABLE_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+class RetryableError(Exception):
+    """Raised when a Places request failed in a way that may succeed on retry."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many Places requests go out per second."""
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def places_request(bucket: TokenBucket, url: str, params: dict) -> dict:
+    """Make one rate-limited Places request, raising RetryableError on transient failures."""
+    bucket.acquire()
+    try:
+        response = requests.get(url, params=params, timeout=10)
+    except requests.RequestException as e:
+        raise RetryableError(str(e))
+
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"HTTP {response.status_code}")
+
+    try:
+        data = response.json()
+    except ValueError:
+        # Proxies and gateways sometimes answer with an HTML error page
+        raise RetryableError(f"HTTP {response.status_code} with non-JSON body")
+    if data.get("status") in RETRYABLE_STATUSES:
+        raise RetryableError(data["status"])
+    return data
+
+
+def places_request_with_retry(bucket: TokenBucket, url: str, params: dict,
+                              max_retries: int, base_delay: float) -> dict:
+    """Retry a single Places request with exponential backoff and jitter on transient failures."""
+    for attempt in range(max_retries + 1):
+        try:
+            return places_request(bucket, url, params)
+        except RetryableError as e:
+            if attempt == max_retries:
+                raise
+            delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+            logging.warning(f"Retrying {url} in {delay:.1f}s ({str(e)})")
+            time.sleep(delay)
+
+
+def lookup_photo(bucket: TokenBucket, site: dict, max_retries: int, base_delay: float) -> Optional[str]:
+    """
+    Resolve a photo URL for a site, mirroring get_place_photo in app.py.
+    Each Places call is retried on its own so a failed details call does not repeat the search.
+    """
+    api_key = os.environ.get("GOOGLE_MAPS_API_KEY")
+
+    try:
+        search_data = places_request_with_retry(bucket, SEARCH_URL, {
+            "query": site['site_name'],
+            "location": f"{site['latitude']},{site['longitude']}",
+            "radius": "1000",  # 1km radius
+            "key": api_key
+        }, max_retries, base_delay)
+        if search_data["status"] != "OK" or not search_data["results"]:
+            return None
+
+        place_id = search_data["results"][0]["place_id"]
+
+        details_data = places_request_with_retry(bucket, DETAILS_URL, {
+            "place_id": place_id,
+            "fields": "photos",
+            "key": api_key
+        }, max_retries, base_delay)
+        if details_data["status"] != "OK" or not details_data["result"].get("photos"):
+            return None
+    except RetryableError as e:
+        logging.error(f"Giving up on {site['site_name']} after {max_retries + 1} attempts: {str(e)}")
+        return None
+
+    photo_reference = details_data["result"]["photos"][0]["photo_reference"]
+    return f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=800&photoreference={photo_reference}&key={api_key}"
+
+
+def fetch_sites_missing_photos() -> list[dict]:
+    """Fetch the columns needed for a lookup for every site whose photo_url is still null."""
+    response = (
+        supabase.table('sites')
+        .select('id, site_name, latitude, longitude')
+        .is_('photo_url', 'null')
+        .execute()
+    )
+    return response.data or []
+
+
+def write_photo(site_id, photo_url: str) -> bool:
+    """
+    Write a resolved photo URL back to Supabase, touching only photo_url.
+    Returns whether a row was actually updated; failures are logged so one bad write doesn't abort the run.
+    """
+    try:
+        # Only fill photos that are still missing, so concurrent edits win
+        response = (
+            supabase.table('sites')
+            .update({'photo_url': photo_url})
+            .eq('id', site_id)
+            .is_('photo_url', 'null')
+            .execute()
+        )
+    except Exception as e:
+        logging.error(f"Failed to write photo for site {site_id}: {str(e)}")
+        return False
+
+    if not response.data:
+        logging.info(f"Skipped site {site_id}: photo already set or site deleted")
+        return False
+    return True
+
+
+def backfill_photos(workers: int = 4, rate: float = 5.0, max_retries: int = 3,
+                    base_delay: float = 1.0) -> dict:
+    """
+    Resolves photos for all sites stored without one, using a bounded pool of workers
+    sharing a token bucket so the Places API quota is never exceeded.
+    """
+    sites = fetch_sites_missing_photos()
+    print(f"Found {len(sites)} sites without photos")
+    if not sites:
+        return {"resolved": 0, "missing": 0}
+
+    bucket = TokenBucket(rate)
+    resolved = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(lookup_photo, bucket, site, max_retries, base_delay): site
+            for site in sites
+        }
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                photo_url = future.result()
+            except Exception as e:
+                logging.error(f"Error backfilling photo for {site['site_name']}: {str(e)}")
+                continue
+
+            if photo_url and write_photo(site['id'], photo_url):
+                resolved += 1
+
+    print(f"Resolved {resolved} of {len(sites)} missing photos")
+    return {"resolved": resolved, "missing": len(sites) - resolved}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill missing site photos from Google Places.")
+    parser.add_argument('--workers', type=int, default=4, help="number of concurrent lookups")
+    parser.add_argument('--rate', type=float, default=5.0, help="maximum Places requests per second")
+    parser.add_argument('--max-retries', type=int, default=3, help="retries per Places request on transient errors")
+    parser.add_argument('--base-delay', type=float, default=1.0, help="initial backoff delay in seconds")
+    args = parser.parse_args()
+
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.max_retries < 0:
+        parser.error("--max-retries must not be negative")
+    if args.base_delay < 0:
+        parser.error("--base-delay must not be negative")
+
+    backfill_photos(
+        workers=args.workers,
+        rate=args.rate,
+        max_retries=args.max_retries,
+        base_delay=args.base_delay
+    )
@@ -1,11 +1,15 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
 import os
 import json
 import ast  # Add this import for safely evaluating string representations of lists
 import requests
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
 from typing import Optional
 from dotenv import load_dotenv
 import logging
@@ -42,6 +46,23 @@ CORS(app)  # This allows requests from your Next.js frontend
 # Initialize the model once at startup
 model = SentenceTransformer('all-mpnet-base-v2')
 
+# Rankings are cached per (query, catalog generation) so later pages are just slices.
+# The catalog is a shared copy of the sites table. It is rebuilt when its database
+# fingerprint changes (inserts, deletes, backfilled photos) or after CATALOG_TTL, which
+# bounds how long in-place edits such as new descriptions or embeddings go unseen.
+VERSION_CHECK_INTERVAL = 5  # seconds between fingerprint queries
+CATALOG_TTL = 300  # seconds
+RANKING_CACHE_SIZE = 256
+MMR_CANDIDATES = 50  # only the head of the ranking is re-ranked for diversity
+MAX_TOP_K = 50
+SITE_COLUMNS = 'id, site_name, description, latitude, longitude, photo_url, embeddings'
+ranking_cache = OrderedDict()
+ranking_cache_lock = threading.Lock()
+catalog = None  # shared copy of the sites table for the current catalog version
+catalog_generation = 0  # bumped on every rebuild so rankings never outlive their catalog
+catalog_lock = threading.Lock()
+catalog_version_state = (None, 0.0)  # last fingerprint and when it was read
+
 def get_place_photo(place_name: str, location: tuple[float, float]) -> Optional[str]:
     """Fetch a photo for a place using Google Places API."""
     try:
@@ -124,20 +145,40 @@ def process_search():
         
         print(f"Received search query: {query}")
 
-        top_sites = find_similar_sites(query)
+        # Validate paging and diversity parameters
+        try:
+            top_k = int(data.get('top_k', 3))
+            offset = int(data.get('offset', 0))
+            diversity = data.get('diversity')
+            diversity = None if diversity is None else float(diversity)
+        except (TypeError, ValueError):
+            return jsonify({"error": "top_k, offset and diversity must be numbers"}), 400
+
+        if not 1 <= top_k <= MAX_TOP_K:
+            return jsonify({"error": f"top_k must be between 1 and {MAX_TOP_K}"}), 400
+        if offset < 0:
+            return jsonify({"error": "offset must be non-negative"}), 400
+        if diversity is not None and not 0 <= diversity <= 1:
+            return jsonify({"error": "diversity must be between 0 and 1"}), 400
+
+        top_sites, total = find_similar_sites(query, top_k, offset, diversity)
         
         if not top_sites:
             return jsonify({
                 "message": "No matching sites found",
-                "query": query
+                "query": query,
+                "total": total
             })
         
         # Convert the pandas Series objects to dictionaries
         site_names = [site['site_name'] for site in top_sites]
         
         return jsonify({
-            "message": f"Top 3 recommended sites for you: {', '.join(site_names)}",
+            "message": f"Top {len(top_sites)} recommended sites for you: {', '.join(site_names)}",
             "query": query,
+            "top_k": top_k,
+            "offset": offset,
+            "total": total,
             "sites": [{
                 'name': site['site_name'],
                 'description': site['description'],
@@ -152,52 +193,176 @@ def process_search():
         print(f"Error in process_search: {str(e)}")
         return jsonify({"error": str(e)}), 500
     
-def find_similar_sites(query, top_k=3):
+def parse_embeddings(sites, dim):
+    """Parse the space-separated embedding strings of all sites into one matrix."""
+    embeddings = np.zeros((len(sites), dim), dtype=np.float32)
+    for i, site in enumerate(sites):
+        embedding_str = site.get('embeddings') or ''
+        try:
+            # Split by whitespace and convert to float, handling scientific notation
+            embedding = np.array(embedding_str.strip('[]').split(), dtype=np.float32)
+            embeddings[i] = embedding
+        except Exception as e:
+            # Leave a zero vector so the site scores a similarity of 0
+            print(f"Error processing site {site['site_name']}: {str(e)}")
+            print(f"Problematic embedding string: {embedding_str[:200]}...")
+    return embeddings
+
+def get_catalog_version():
+    """
+    Returns a cheap fingerprint of the sites table: row count, newest id and number of photos.
+    The database is queried at most once every VERSION_CHECK_INTERVAL seconds.
+    """
+    global catalog_version_state
+    version, checked_at = catalog_version_state
+    now = time.monotonic()
+    if version is not None and now - checked_at < VERSION_CHECK_INTERVAL:
+        return version
+
+    latest = supabase.table('sites').select('id', count='exact').order('id', desc=True).limit(1).execute()
+    photos = supabase.table('sites').select('id', count='exact').not_.is_('photo_url', 'null').limit(1).execute()
+    max_id = latest.data[0]['id'] if latest.data else None
+    version = (latest.count, max_id, photos.count)
+    catalog_version_state = (version, now)
+    return version
+
+def get_catalog(version):
+    """
+    Returns the shared catalog for a version, refetching the sites when it changed or expired.
+    Embedding strings are parsed into a normalized matrix and dropped from the site rows.
+    """
+    global catalog, catalog_generation
+    now = time.monotonic()
+    with catalog_lock:
+        if catalog and catalog['version'] == version and now - catalog['created'] < CATALOG_TTL:
+            return catalog
+
+    # Fetch all sites from Supabase, ordered so indices are stable across rebuilds
+    response = supabase.table('sites').select(SITE_COLUMNS).order('id').execute()
+    sites = response.data
+
+    if not sites:
+        print("No sites found in database")
+        return None
+
+    embeddings = parse_embeddings(sites, model.get_sentence_embedding_dimension())
+    for site in sites:
+        site.pop('embeddings', None)
+
+    # Normalize once so cosine similarity is a single matrix-vector product
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+
+    with catalog_lock:
+        catalog_generation += 1
+        catalog = {
+            'version': version,
+            'generation': catalog_generation,
+            'created': now,
+            'sites': sites,
+            'embeddings': embeddings,
+            'valid': norms[:, 0] > 0  # False for sites whose embedding failed to parse
+        }
+        current = catalog
+    with ranking_cache_lock:
+        for key in [key for key in ranking_cache if key[1] != current['generation']]:
+            del ranking_cache[key]
+    return current
+
+def get_ranking(query, catalog):
     """
-    Finds the top_k most similar national park sites to a given search query based on embeddings.
+    Returns the full similarity ranking for a query, computing it only on a cache miss.
+    Entries hold only the ranked site indices and scores; site data lives in the catalog.
+    """
+    key = (query, catalog['generation'])
+    with ranking_cache_lock:
+        entry = ranking_cache.get(key)
+        if entry:
+            ranking_cache.move_to_end(key)
+            return entry
+
+    search_embedding = model.encode(query).astype(np.float32)
+    search_embedding = search_embedding / (np.linalg.norm(search_embedding) or 1)
+    similarities = catalog['embeddings'] @ search_embedding
+
+    order = np.argsort(-similarities, kind='stable')
+    entry = {
+        'order': order,
+        'similarities': similarities[order],
+        'mmr_orders': {}
+    }
+    with ranking_cache_lock:
+        # Skip caching if the catalog was rebuilt while this ranking was computed
+        if catalog['generation'] == catalog_generation:
+            ranking_cache[key] = entry
+        while len(ranking_cache) > RANKING_CACHE_SIZE:
+            ranking_cache.popitem(last=False)
+    return entry
+
+def mmr_order(entry, catalog, diversity):
+    """
+    Re-ranks the head of a cached ranking with Maximal Marginal Relevance and returns
+    positions into the ranking. Higher diversity trades relevance for dissimilarity to
+    sites already picked. Sites without a usable embedding are left out of the re-ranking.
+    """
+    diversity = round(diversity, 2)
+    if diversity in entry['mmr_orders']:
+        return entry['mmr_orders'][diversity]
+
+    ranked = entry['order']
+    head = np.flatnonzero(catalog['valid'][ranked])[:MMR_CANDIDATES]
+    n = len(head)
+    embeddings = catalog['embeddings'][ranked[head]]
+    relevance = entry['similarities'][head]
+    pairwise = embeddings @ embeddings.T
+
+    selected = []
+    max_similarity = np.zeros(n, dtype=np.float32)
+    remaining = np.ones(n, dtype=bool)
+    for _ in range(n):
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        max_similarity = np.maximum(max_similarity, pairwise[best])
+
+    # Everything outside the re-ranked head keeps its relevance order
+    rest = np.ones(len(ranked), dtype=bool)
+    rest[head] = False
+    order = head[selected].tolist() + np.flatnonzero(rest).tolist()
+    entry['mmr_orders'][diversity] = order
+    return order
+
+def find_similar_sites(query, top_k=3, offset=0, diversity=None):
+    """
+    Finds the top_k most similar national park sites to a given search query based on embeddings,
+    starting at offset. Returns the page of sites and the total number of ranked sites.
     """
     try:
-        # Fetch all sites from Supabase
-        response = supabase.table('sites').select('*').execute()
-        sites = response.data
-        
-        if not sites:
-            print("No sites found in database")
-            return []
-            
-        similarity_scores = []
-        search_embedding = model.encode(query)
-        
-        # Process each site's embeddings
-        for site in sites:
-            try:
-                # Get the embedding string and convert it to a list of floats
-                embedding_str = site['embeddings']
-                # Split by whitespace and convert to float, handling scientific notation
-                embedding_list = [float(x) for x in embedding_str.strip('[]').split()]
-                
-                # Calculate similarity
-                similarity_score = util.cos_sim(embedding_list, search_embedding).item()
-                similarity_scores.append(similarity_score)
-                
-            except Exception as e:
-                print(f"Error processing site {site['site_name']}: {str(e)}")
-                print(f"Problematic embedding string: {embedding_str[:200]}...")
-                similarity_scores.append(0)
-
-        # Add similarity scores to sites
-        for site, score in zip(sites, similarity_scores):
-            site['similarity'] = score
-
-        # Sort by similarity and get top_k
-        sorted_sites = sorted(sites, key=lambda x: x['similarity'], reverse=True)[:top_k]
-        print(f"\nTop {top_k} sites found with scores: {[site['similarity'] for site in sorted_sites]}")
-
-        return sorted_sites
+        version = get_catalog_version()
+        current = get_catalog(version)
+        if not current:
+            return [], 0
+
+        entry = get_ranking(query, current)
+        total = len(entry['order'])
+        if diversity:
+            positions = mmr_order(entry, current, diversity)[offset:offset + top_k]
+        else:
+            positions = range(offset, min(offset + top_k, total))
+
+        page = [{
+            **current['sites'][entry['order'][p]],
+            'similarity': float(entry['similarities'][p])
+        } for p in positions]
+        print(f"\nTop {top_k} sites from offset {offset} found with scores: {[site['similarity'] for site in page]}")
+
+        return page, total
 
     except Exception as e:
         print(f"An error occurred in find_similar_sites: {str(e)}")
-        return []
+        return [], 0
 
 @app.route('/all_sites', methods=['GET'])
 def get_all_sites():
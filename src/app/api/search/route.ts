@@ -5,7 +5,7 @@ const backendUrl = process.env.VERCEL_URL ? `https://${process.env.VERCEL_URL}/p
 export async function POST(request: Request) {
   try {
     const body = await request.json();
-    const { query } = body;
+    const { query, top_k, offset, diversity } = body;
     
     // Forward the request to our Python backend
     const response = await fetch(backendUrl, {
@@ -13,7 +13,7 @@ export async function POST(request: Request) {
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ query }),
+      body: JSON.stringify({ query, top_k, offset, diversity }),
     });
 
     const data = await response.json();